@@ -1,35 +1,61 @@
+import os
 import pandas as pd
 import matplotlib
-matplotlib.use('TkAgg')  # Use TkAgg backend for tkinter
+if 'MPLBACKEND' not in os.environ:
+    matplotlib.use('TkAgg')  # Use TkAgg backend for tkinter unless MPLBACKEND picks another one
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+import matplotlib.colors as mcolors
 from matplotlib.widgets import Button
+from matplotlib.collections import LineCollection
 import numpy as np
 from datetime import datetime
 import sys
 
+def m4_indices(x, y, n_bins, x_min=None, x_max=None):
+    """Indices of the first, last, lowest and highest point in each of n_bins equal-width bins over [x_min, x_max] (M4 downsampling of sorted x)"""
+    if len(x) <= 4 * n_bins:
+        return np.arange(len(x))
+    
+    # Bins span the given range (the view), defaulting to the data's own extent
+    x_min = x[0] if x_min is None else x_min
+    x_max = x[-1] if x_max is None else x_max
+    if x_max <= x_min:
+        return np.arange(len(x))
+    
+    # Bin number of every point; x is sorted so each bin is a contiguous run
+    bins = np.clip(np.floor((x - x_min) * (n_bins / (x_max - x_min))).astype(np.int64), 0, n_bins - 1)
+    group_starts = np.r_[0, np.flatnonzero(np.diff(bins)) + 1]
+    group_ends = np.r_[group_starts[1:], len(x)] - 1
+    
+    # Ordering by (bin, y) keeps the same runs, with each run's min first and max last
+    by_value = np.lexsort((y, bins))
+    return np.unique(np.concatenate([group_starts, group_ends, by_value[group_starts], by_value[group_ends]]))
+
 class InteractiveWeightPlot:
     def __init__(self):
-        # Read the CSV file
-        self.df = pd.read_csv('chart.csv')
-        
-        # Parse the DateTime column
-        self.df['DateTime'] = pd.to_datetime(self.df['DateTime'])
+        # Read the CSV file, parsing DateTime into the index and keeping only the columns we use.
+        # skiprows=[1] ignores the first datapoint (header row) at parse time.
+        self.df = pd.read_csv('chart.csv', usecols=['DateTime', 'Daily Average'], skiprows=[1],
+                              index_col='DateTime', parse_dates=['DateTime'],
+                              dtype={'Daily Average': 'float32'})
         
-        # Ignore the first datapoint (header row)
-        self.df = self.df.iloc[1:].reset_index(drop=True)
+        # Normalize to timezone-naive timestamps once, so nothing downstream has to handle tz
+        if self.df.index.tz is not None:
+            self.df.index = self.df.index.tz_localize(None)
         
-        # Ensure we have proper datetime index
-        self.df = self.df.set_index('DateTime')
+        # Calculate weekly averages over the same Tuesday-to-Monday weeks as pandas' 'W-MON' periods
+        self.weekly_avg = self.df['Daily Average'].resample('W-TUE', closed='left', label='left').mean().dropna()
         
-        # Add week number starting from Monday
-        self.df['Week'] = self.df.index.to_period('W-MON')
+        # Get week start dates for each week
+        self.week_starts = self.weekly_avg.index.to_numpy()
         
-        # Calculate weekly averages
-        self.weekly_avg = self.df.groupby('Week')['Daily Average'].mean()
+        # Plain array/list views of the weekly averages for cheap per-event indexing
+        self._wavg_values = self.weekly_avg.to_numpy()
+        self._wavg_periods = list(self.weekly_avg.index.to_period('W-MON'))
         
-        # Get week start dates for each week
-        self.week_starts = self.weekly_avg.index.to_timestamp()
+        # Week starts as sorted matplotlib date numbers, used for plotting and fast nearest-point lookup
+        self._week_nums = mdates.date2num(self.week_starts)
         
         # Initialize trend line variables
         self.trend_start_idx = None
@@ -40,7 +66,7 @@ class InteractiveWeightPlot:
         # Visual feedback for selected points
         self.start_marker = None
         self.end_marker = None
-        self.point_colors = None  # Will be initialized after week_starts is available
+        self.point_colors = None  # RGBA array, initialized once the week colors are known
         
         # Create the plot
         self.setup_plot()
@@ -49,35 +75,47 @@ class InteractiveWeightPlot:
         """Set up the matplotlib figure and plot"""
         self.fig, self.ax = plt.subplots(figsize=(12, 8))
         
+        # Artists are given matplotlib date numbers directly, so declare the x axis as dates up front
+        self.ax.xaxis_date()
+        
         # Pick a categorical color palette (handle up to 20 weeks)
         color_palette = plt.get_cmap('tab20')
-        unique_weeks = sorted(self.df['Week'].unique())
-        week_to_color = {week: color_palette(i % 20) for i, week in enumerate(unique_weeks)}
+        weekly_colors = [color_palette(i % 20) for i in range(len(self._week_nums))]
+
+        # Daily points as sorted date numbers (missing readings are never drawn, so drop them)
+        daily = self.df['Daily Average'].dropna().sort_index()
+        self._daily_nums = mdates.date2num(daily.index.to_numpy())
+        self._daily_values = daily.to_numpy()
 
         # Assign a color to each row for its week
-        self.df['Color'] = self.df['Week'].map(week_to_color)
-        # For weekly averages: use color for that week
-        weekly_colors = [week_to_color[week] for week in self.weekly_avg.index]
+        row_weeks = np.searchsorted(self._week_nums, self._daily_nums, side='right') - 1
+        self._daily_colors = np.asarray(weekly_colors)[row_weeks]
 
-        # Plot individual data points, colored by week
-        self.ax.scatter(self.df.index, self.df['Daily Average'], 
-                       color=self.df['Color'], s=30, alpha=0.7, label='Daily Weight')
+        # Plot individual data points, colored by week (static background layer, so rasterized)
+        # Downsampled to about 4 points per pixel column, and re-downsampled whenever the x range changes
+        idx = m4_indices(self._daily_nums, self._daily_values, self.pixel_columns())
+        self.daily_scatter = self.ax.scatter(self._daily_nums[idx], self._daily_values[idx],
+                                             color=self._daily_colors[idx], s=30, alpha=0.7, label='Daily Weight',
+                                             rasterized=True, zorder=1)
 
         # Plot weekly averages as bigger dots using matching colors
-        self.weekly_scatter = self.ax.scatter(self.week_starts, self.weekly_avg.values, 
+        self.weekly_scatter = self.ax.scatter(self._week_nums, self._wavg_values, 
                                              c=weekly_colors, s=60, zorder=5, label='Weekly Average')
 
         # Draw lines between weekly averages (keep a single color for clarity)
-        self.weekly_line, = self.ax.plot(self.week_starts, self.weekly_avg.values, 
+        self.weekly_line, = self.ax.plot(self._week_nums, self._wavg_values, 
                                        color='gray', linewidth=2, alpha=0.7, zorder=4)
 
         # Store for potential downstream usage
-        self.point_colors = list(weekly_colors)
-        self.week_colors = list(weekly_colors)  # <-- Save the canonical color mapping
+        self.week_colors = np.asarray(weekly_colors, dtype=np.float32).reshape(-1, 4)  # <-- Save the canonical color mapping
+        self.point_colors = self.week_colors.copy()
         
-        # Add vertical lines for each week boundary
-        for week_start in self.week_starts:
-            self.ax.axvline(x=week_start, color='gray', linestyle='--', alpha=0.3)
+        # Add vertical lines for each week boundary (one collection, spanning the full axes height)
+        week_segments = np.stack([np.column_stack([self._week_nums, np.zeros_like(self._week_nums)]),
+                                  np.column_stack([self._week_nums, np.ones_like(self._week_nums)])], axis=1)
+        self.ax.add_collection(LineCollection(week_segments, transform=self.ax.get_xaxis_transform(),
+                                              colors='gray', linestyles='--', alpha=0.3),
+                               autolim=False)
         
         # Format the plot
         self.ax.set_title('Weight Tracking with Interactive Trend Line', fontsize=14, fontweight='bold')
@@ -93,6 +131,8 @@ class InteractiveWeightPlot:
         
         # Connect mouse events
         self.fig.canvas.mpl_connect('button_press_event', self.on_click)
+        self.ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+        self.fig.canvas.mpl_connect('resize_event', self.on_resize)
         # Removed motion_notify_event and button_release_event connections (dragging endpoints no longer supported)
         
         # Add instructions
@@ -113,28 +153,18 @@ class InteractiveWeightPlot:
                     bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.8))
     
     def find_closest_week_index(self, x_coord):
-        """Find the closest weekly average point to the given x coordinate"""
-        if len(self.week_starts) == 0:
+        """Find the closest weekly average point to the given x coordinate (matplotlib date number)"""
+        if len(self._week_nums) == 0:
             return None
-        
-        # Convert x coordinate to datetime if it's not already
-        if isinstance(x_coord, (int, float)):
-            x_coord = mdates.num2date(x_coord)
-        
-        # Make sure both datetimes are timezone-naive for comparison
-        if hasattr(x_coord, 'tzinfo') and x_coord.tzinfo is not None:
-            x_coord = x_coord.replace(tzinfo=None)
-        
-        # Find the closest week start date
-        distances = []
-        for week_start in self.week_starts:
-            # Ensure week_start is also timezone-naive
-            if hasattr(week_start, 'tzinfo') and week_start.tzinfo is not None:
-                week_start = week_start.replace(tzinfo=None)
-            distances.append(abs((x_coord - week_start).total_seconds()))
-        
-        closest_idx = distances.index(min(distances))
-        return closest_idx
+        if len(self._week_nums) == 1:
+            return 0
+        
+        # Bisect into the sorted week starts, then pick the nearer of the two neighbours
+        i = int(np.searchsorted(self._week_nums, x_coord))
+        i = min(max(i, 1), len(self._week_nums) - 1)
+        if abs(self._week_nums[i - 1] - x_coord) <= abs(self._week_nums[i] - x_coord):
+            return i - 1
+        return i
     
     def on_click(self, event):
         """Handle mouse click events"""
@@ -151,12 +181,12 @@ class InteractiveWeightPlot:
                 # Set start point
                 self.trend_start_idx = closest_idx
                 self.highlight_point(closest_idx, 'green')
-                print(f"Trend line start set to Week {closest_idx}: {self.weekly_avg.index[closest_idx]} → {self.weekly_avg.iloc[closest_idx]:.2f} kg")
+                print(f"Trend line start set to Week {closest_idx}: {self._wavg_periods[closest_idx]} → {self._wavg_values[closest_idx]:.2f} kg")
             elif self.trend_end_idx is None:
                 # Set end point
                 self.trend_end_idx = closest_idx
                 self.highlight_point(closest_idx, 'green')
-                print(f"Trend line end set to Week {closest_idx}: {self.weekly_avg.index[closest_idx]} → {self.weekly_avg.iloc[closest_idx]:.2f} kg")
+                print(f"Trend line end set to Week {closest_idx}: {self._wavg_periods[closest_idx]} → {self._wavg_values[closest_idx]:.2f} kg")
                 self.draw_trend_line()
             else:
                 # Reset and start over
@@ -164,7 +194,7 @@ class InteractiveWeightPlot:
                 self.trend_start_idx = closest_idx
                 self.trend_end_idx = None  # Reset end point
                 self.highlight_point(closest_idx, 'green')
-                print(f"Reset: Trend line start set to Week {closest_idx}: {self.weekly_avg.index[closest_idx]} → {self.weekly_avg.iloc[closest_idx]:.2f} kg")
+                print(f"Reset: Trend line start set to Week {closest_idx}: {self._wavg_periods[closest_idx]} → {self._wavg_values[closest_idx]:.2f} kg")
         
         elif event.button == 3:  # Right click
             # Reset trend line
@@ -183,22 +213,48 @@ class InteractiveWeightPlot:
         # Functionality removed (dragging endpoints no longer supported)
         pass
     
+    def on_xlim_changed(self, ax):
+        """Re-downsample the daily points for the new visible x range"""
+        self.update_daily_points()
+    
+    def on_resize(self, event):
+        """Re-downsample the daily points for the new axes width"""
+        self.update_daily_points()
+    
+    def pixel_columns(self):
+        """Width of the axes in display pixels"""
+        return max(int(self.ax.bbox.width), 1)
+    
+    def update_daily_points(self):
+        """Show only the M4-downsampled daily points within the visible x range"""
+        # Bin only the points inside the view, so bins line up with pixel columns
+        x_min, x_max = self.ax.get_xlim()
+        lo = int(np.searchsorted(self._daily_nums, x_min))
+        hi = int(np.searchsorted(self._daily_nums, x_max, side='right'))
+        idx = lo + m4_indices(self._daily_nums[lo:hi], self._daily_values[lo:hi], self.pixel_columns(), x_min, x_max)
+        
+        # Keep one point past each edge so markers straddling the axes edges still show
+        idx = np.r_[np.arange(max(lo - 1, 0), lo), idx, np.arange(hi, min(hi + 1, len(self._daily_nums)))]
+        
+        self.daily_scatter.set_offsets(np.column_stack([self._daily_nums[idx], self._daily_values[idx]]))
+        self.daily_scatter.set_color(self._daily_colors[idx])
+    
     def draw_trend_line(self):
         """Draw or update the trend line"""
         if self.trend_start_idx is None or self.trend_end_idx is None:
             return
         
-        # Clear existing trend line
-        self.clear_trend_line()
+        # Reset point colors
+        self.reset_point_colors()
         
         # Ensure start is before end
         if self.trend_start_idx > self.trend_end_idx:
             self.trend_start_idx, self.trend_end_idx = self.trend_end_idx, self.trend_start_idx
         
-        start_week = self.weekly_avg.index[self.trend_start_idx]
-        end_week = self.weekly_avg.index[self.trend_end_idx]
-        start_weight = self.weekly_avg.iloc[self.trend_start_idx]
-        end_weight = self.weekly_avg.iloc[self.trend_end_idx]
+        start_week = self._wavg_periods[self.trend_start_idx]
+        end_week = self._wavg_periods[self.trend_end_idx]
+        start_weight = self._wavg_values[self.trend_start_idx]
+        end_weight = self._wavg_values[self.trend_end_idx]
         
         # Calculate statistics
         num_weeks = self.trend_end_idx - self.trend_start_idx
@@ -206,7 +262,7 @@ class InteractiveWeightPlot:
         
         # Draw trend line
         self.trend_line, = self.ax.plot(
-            [self.week_starts[self.trend_start_idx], self.week_starts[self.trend_end_idx]],
+            [self._week_nums[self.trend_start_idx], self._week_nums[self.trend_end_idx]],
             [start_weight, end_weight],
             'g--', linewidth=3, alpha=0.8, label=f'Trend Line ({num_weeks} weeks)'
         )
@@ -231,26 +287,28 @@ class InteractiveWeightPlot:
         
         # Update legend
         self.ax.legend()
-        self.fig.canvas.draw()
+        self.fig.canvas.draw_idle()
     
     def highlight_point(self, idx, color='green'):
         """Change the color of a specific weekly average point temporarily (e.g. for highlight)"""
         # Change color at idx, keep others as is
-        self.point_colors[idx] = color
-        self.weekly_scatter.set_color(self.point_colors)
-        self.fig.canvas.draw()
+        self.point_colors[idx] = mcolors.to_rgba(color)
+        self.weekly_scatter.set_facecolors(self.point_colors)
+        self.fig.canvas.draw_idle()
 
     def reset_point_colors(self):
         """Reset all weekly average points to their canonical week color"""
-        self.point_colors = list(self.week_colors)
-        self.weekly_scatter.set_color(self.point_colors)
-        self.fig.canvas.draw()
+        self.point_colors[:] = self.week_colors
+        self.weekly_scatter.set_facecolors(self.point_colors)
+        self.fig.canvas.draw_idle()
     
     def clear_trend_line(self):
         """Clear the existing trend line, text, and reset colors"""
         if self.trend_line:
             self.trend_line.remove()
             self.trend_line = None
+            # Drop the trend entry from the legend
+            self.ax.legend()
         if self.trend_text:
             self.trend_text.remove()
             self.trend_text = None